@@ -2,10 +2,12 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import date
+import calendar
 from pathlib import Path
+import os
 import pickle
-import matplotlib.pyplot as plt
+import threading
 import base64
 
 
@@ -32,14 +34,18 @@ except NameError:
     # Fallback if __file__ doesn't exist (e.g., in notebooks)
     BASE_DIR = Path(os.getcwd())
 
+# Encoded image is cached; the mtime argument refreshes it if the file changes
+@st.cache_data
+def _encode_bg(path, mtime):
+    return base64.b64encode(Path(path).read_bytes()).decode()
+
 # Background Image Function
 def set_bg(image_file):
     # Construct the full path to the image
     image_path = BASE_DIR / image_file
     
     if image_path.exists():
-        with open(image_path, "rb") as f:
-            encoded = base64.b64encode(f.read()).decode()
+        encoded = _encode_bg(str(image_path), os.path.getmtime(image_path))
         
         st.markdown(
             f"""
@@ -78,47 +84,140 @@ except NameError:
     # Fallback if __file__ doesn't exist (like in notebooks)
     BASE_DIR = Path(os.getcwd())
 
-# 2. Load trained model using the full path
-with open(BASE_DIR / "finalized_model.sav", "rb") as f:
-    loaded_model = pickle.load(f)
-
-# 3. Load scaler using the full path
-with open(BASE_DIR / "scaler.sav", "rb") as f:
-    sc = pickle.load(f)
-
-# 4. Load model columns using the full path
-with open(BASE_DIR / "model_columns.pkl", "rb") as f:
-    X_columns = pickle.load(f)
-
-# 5. Load dataset using the full path
-food = pd.read_csv(BASE_DIR / "Export.csv", on_bad_lines="skip")
-
-# Convert date to datetime for processing
-food['date'] = pd.to_datetime(food['date'], errors='coerce')
-
-# Extract dropdown options
-region_options = sorted(food['admin1'].dropna().unique())      # admin1 as Region
-district_options = sorted(food['admin2'].dropna().unique())    # admin2 as District
-market_options = sorted(food['market'].dropna().unique())
-category_options = sorted(food['category'].dropna().unique())
-commodity_options = sorted(food['commodity'].dropna().unique())
-unit_options = sorted(food['unit'].dropna().unique())
-priceflag_options = sorted(food['priceflag'].dropna().unique())
-pricetype_options = sorted(food['pricetype'].dropna().unique())
-
+# Model input features
+CATEGORICAL_COLS = ['admin1', 'admin2', 'market', 'category',
+                    'commodity', 'unit', 'priceflag', 'pricetype']
+NUMERIC_COLS = ['year', 'month', 'day', 'week']
+
+# 2-4. Load trained model, scaler and model columns once per process
+@st.cache_resource
+def _load_artifacts():
+    with open(BASE_DIR / "finalized_model.sav", "rb") as f:
+        model = pickle.load(f)
+    with open(BASE_DIR / "scaler.sav", "rb") as f:
+        scaler = pickle.load(f)
+    with open(BASE_DIR / "model_columns.pkl", "rb") as f:
+        columns = pickle.load(f)
+    # Positions used to build the input vector directly: one value -> column
+    # dict per one-hot feature ("admin1_Dodoma" -> value_pos['admin1']['Dodoma'])
+    # and the positions of the numeric date features
+    value_pos = {}
+    for i, name in enumerate(columns):
+        col, sep, val = name.partition('_')
+        if sep:
+            value_pos.setdefault(col, {})[val] = i
+    numeric_pos = np.array([columns.get_loc(c) for c in NUMERIC_COLS], dtype=np.intp)
+    # StandardScaler parameters, applied inline to the single-row input
+    scale_mean = scaler.mean_ if scaler.with_mean else 0.0
+    scale_std = scaler.scale_ if scaler.with_std else 1.0
+    return model, columns, value_pos, numeric_pos, scale_mean, scale_std
+
+(loaded_model, X_columns, value_pos, numeric_pos,
+ scale_mean, scale_std) = _load_artifacts()
+
+# 5. Load dataset and dropdown options once, served from cache on reruns
+HISTORY_KEY_COLS = ['commodity', 'admin1', 'market']
+# Part of the Parquet copy's filename; bump it whenever the processing in
+# load_data changes so copies written by older code are not reused
+PARQUET_CACHE_VERSION = 2
+
+def _history_key(codes, sizes):
+    # Mixed-radix key from categorical codes; +1 keeps missing values (-1) apart
+    key = 0
+    for code, size in zip(codes, sizes):
+        key = key * (size + 1) + (code + 1)
+    return key
+
+@st.cache_data
+def load_data(path=BASE_DIR / "Export.csv"):
+    # Prefer the Parquet copy written on an earlier cold start, unless the CSV
+    # has changed since or the copy cannot be read
+    csv_path = Path(path)
+    parquet_path = csv_path.with_name(f"{csv_path.stem}.v{PARQUET_CACHE_VERSION}.parquet")
+    df = None
+    if parquet_path.exists() and parquet_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        try:
+            df = pd.read_parquet(parquet_path)
+        except (OSError, ValueError):
+            df = None  # corrupt copy: rebuild it from the CSV below
+    if df is None:
+        # Read only the columns the app uses, with categorical dtype:
+        # comparisons, unique() and groupby work on integer codes
+        df = pd.read_csv(
+            csv_path,
+            usecols=['date', *CATEGORICAL_COLS, 'price'],
+            dtype={c: 'category' for c in CATEGORICAL_COLS},
+            on_bad_lines="skip",
+            # Multithreaded tokenizer, faster cold starts. It also skips the
+            # malformed rows (unquoted commas such as "meat, fish and eggs")
+            # together with usecols, which the C engine does not; the schema
+            # check below catches such rows if the engine is ever changed
+            engine="pyarrow",
+        )
 
+        # Rows whose fields shifted past the header would leave text in the
+        # price column; fail loudly rather than load them
+        if not pd.api.types.is_numeric_dtype(df['price']):
+            raise ValueError(f"{csv_path.name}: non-numeric values in the price column")
+
+        # Convert date to datetime for processing
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d', errors='coerce', cache=True)
+
+        # float32 prices; rows without a usable date or price are dropped once here.
+        # (to_numeric's downcast keeps float64 when float32 would round the values)
+        df['price'] = df['price'].astype('float32')
+        df = df.dropna(subset=['date', 'price'])
+
+        # Sort by date once so every history slice is already in order
+        df = df.sort_values('date', kind='mergesort').reset_index(drop=True)
+
+        # Write to a per-worker temp file and rename it into place, so another
+        # worker starting at the same time never reads a half-written copy
+        tmp_path = parquet_path.with_name(
+            f"{parquet_path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, parquet_path)
+        except OSError:
+            # read-only deployments simply go without the warm-start copy
+            tmp_path.unlink(missing_ok=True)
+
+    # Extract dropdown options
+    opts = {c: sorted(df[c].dropna().unique().tolist()) for c in CATEGORICAL_COLS}
+
+    # Sorted (commodity, region, market) keys and the row order that matches
+    # them; the stable sort keeps each history slice in date order
+    sizes = [len(df[c].cat.categories) for c in HISTORY_KEY_COLS]
+    keys = _history_key([df[c].cat.codes.to_numpy().astype(np.int64)
+                         for c in HISTORY_KEY_COLS], sizes)
+    order = np.argsort(keys, kind='stable')
+    history_index = (keys[order], order, sizes)
+    return df, opts, history_index
+
+food, opts, history_index = load_data()
+
+# 6. Create the trend chart figure once and redraw it on each prediction.
+# The figure is shared by every session, so redraws hold the returned lock
+@st.cache_resource
+def _trend_figure():
+    # Imported here so matplotlib is only loaded once a chart is drawn
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(10,4))
+    return fig, ax, threading.Lock()
 
 # --- SIDEBAR INPUTS ---
 st.sidebar.header("Input Market Price Features")
 
-region = st.sidebar.selectbox("Region", region_options)
-district = st.sidebar.selectbox("District", district_options)
-market = st.sidebar.selectbox("Market", market_options)
-category = st.sidebar.selectbox("Category", category_options)
-commodity = st.sidebar.selectbox("Commodity", commodity_options)
-unit = st.sidebar.selectbox("Unit", unit_options)
-priceflag = st.sidebar.selectbox("Price Flag", priceflag_options)
-pricetype = st.sidebar.selectbox("Price Type", pricetype_options)
+region = st.sidebar.selectbox("Region", opts['admin1'])      # admin1 as Region
+district = st.sidebar.selectbox("District", opts['admin2'])  # admin2 as District
+market = st.sidebar.selectbox("Market", opts['market'])
+category = st.sidebar.selectbox("Category", opts['category'])
+commodity = st.sidebar.selectbox("Commodity", opts['commodity'])
+unit = st.sidebar.selectbox("Unit", opts['unit'])
+priceflag = st.sidebar.selectbox("Price Flag", opts['priceflag'])
+pricetype = st.sidebar.selectbox("Price Type", opts['pricetype'])
 
 st.sidebar.markdown("### Enter Date")
 col1, col2, col3 = st.sidebar.columns(3)
@@ -133,39 +232,25 @@ with col3:
 if st.sidebar.button("Predict Price"):
 
     # Calculate week automatically
-    try:
-        date_input = datetime(year, month, day)
-        week = date_input.isocalendar()[1]
-    except:
+    if day <= calendar.monthrange(year, month)[1]:
+        week = date(year, month, day).isocalendar().week
+    else:
         st.error("Invalid date entered!")
         week = 1
 
-    # Create input DataFrame
-    input_dict = {
-        'admin1': region,
-        'admin2': district,
-        'market': market,
-        'category': category,
-        'commodity': commodity,
-        'unit': unit,
-        'priceflag': priceflag,
-        'pricetype': pricetype,
-        'year': year,
-        'month': month,
-        'day': day,
-        'week': week
-    }
-
-    input_df = pd.DataFrame([input_dict])
-
-    # Encode categorical features
-    input_encoded = pd.get_dummies(input_df)
-
-    # Align columns with training data
-    input_encoded = input_encoded.reindex(columns=X_columns, fill_value=0)
+    # Build the encoded input vector directly against the training columns
+    # (same result as get_dummies + reindex, without the temporary DataFrame)
+    input_encoded = np.zeros((1, len(X_columns)), dtype=np.float64)
+    # Values absent from the columns are the dropped baseline categories: all zeros
+    cat_vals = (region, district, market, category, commodity, unit, priceflag, pricetype)
+    positions = [p for p in (value_pos.get(c, {}).get(v) for c, v in
+                             zip(CATEGORICAL_COLS, cat_vals)) if p is not None]
+    input_encoded[0, positions] = 1
+    input_encoded[0, numeric_pos] = (year, month, day, week)
 
     # Scale features
-    input_scaled = sc.transform(input_encoded)
+    # (same arithmetic as StandardScaler.transform, without its feature-name validation)
+    input_scaled = (input_encoded - scale_mean) / scale_std
 
     # Predict
     predicted_price = loaded_model.predict(input_scaled)[0]
@@ -183,23 +268,27 @@ if st.sidebar.button("Predict Price"):
 )
     
     # Filter historical data for the same commodity and region/market
-    history = food[
-        (food['commodity'] == commodity) &
-        (food['admin1'] == region) &
-        (food['market'] == market)
-    ].copy()
-
-    if not history.empty:
-        history_sorted = history.sort_values('date')
-        fig, ax = plt.subplots(figsize=(10,4))
-        ax.plot(history_sorted['date'], history_sorted['price'], marker='o', linestyle='-')
-        ax.axhline(predicted_price, color='red', linestyle='--', label="Predicted Price")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Price (TZS)")
-        ax.set_title(f"Historical Prices for {commodity} in {market}, {region}")
-        ax.legend()
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+    sorted_keys, order, sizes = history_index
+    key = _history_key([food[c].cat.categories.get_loc(v) for c, v in
+                        zip(HISTORY_KEY_COLS, (commodity, region, market))], sizes)
+    lo, hi = np.searchsorted(sorted_keys, [key, key + 1])
+    rows = order[lo:hi]
+
+    if rows.size:
+        # Only the two plotted columns are gathered, no history sub-frame
+        dates = food['date'].to_numpy()[rows]
+        prices = food['price'].to_numpy()[rows]
+        fig, ax, lock = _trend_figure()
+        with lock:
+            ax.clear()
+            ax.plot(dates, prices, marker='o', linestyle='-')
+            ax.axhline(predicted_price, color='red', linestyle='--', label="Predicted Price")
+            ax.set_xlabel("Date")
+            ax.set_ylabel("Price (TZS)")
+            ax.set_title(f"Historical Prices for {commodity} in {market}, {region}")
+            ax.legend()
+            ax.tick_params(axis='x', labelrotation=45)
+            st.pyplot(fig)
     else:
         st.warning("No historical data available for trend chart.")
 